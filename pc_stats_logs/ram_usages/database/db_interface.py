@@ -1,13 +1,17 @@
 import os
-from typing import Any, List, Dict, TypeVar, Type
-from sqlalchemy import select, insert, Integer, func, update, bindparam
+import logging
+from typing import Any, List, Dict, Optional, Tuple, TypeVar, Type
+from sqlalchemy import select, insert, text, Integer, func, update, bindparam
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timezone
 from database.models import Base, to_dict
-from database.engine import AsyncDBSession
+from database.engine import AppSession
 
 
+logger = logging.getLogger(__name__)
+
 _ModelType = TypeVar("_ModelType", bound=Base)
 
 DataObject = Dict[str, Any]
@@ -15,7 +19,7 @@ ListOfDataObjects = List[DataObject]
 
 class DBInterface:
     """
-    A generic database interface for SQLAlchemy models, supporting create and read operations.
+    A generic database interface for SQLAlchemy models, supporting single-row, bulk and COPY create operations.
     """
     def __init__(self, db_class: Type[_ModelType]):
         """
@@ -41,16 +45,119 @@ class DBInterface:
         Raises:
             Exception: If an error occurs during the database operation.
         """
-        async with AsyncDBSession() as session:
+        async with AppSession() as session:
             try:
                 # Instantiate the SQLAlchemy model with the provided data
                 item: _ModelType = self.db_class(**data)
                 session.add(item)
                 await session.commit()
-                await session.refresh(item) # Refresh to get the auto-generated ID (timestamp)
-                result = to_dict(item)
-                return result
+                # 'time' has a Python-side default, so it is already set on item at flush
+                # and survives the commit (expire_on_commit=False): no refresh round-trip needed
+                return to_dict(item)
             except Exception as e:
                 await session.rollback()
-                print(f"Error creating record for {self.db_class.__name__}: {e}")
+                logger.error("Error creating record for %s: %s", self.db_class.__name__, e)
+                raise
+
+    async def bulk_create(self, rows: ListOfDataObjects, session: Optional[AsyncSession] = None) -> int:
+        """
+        Inserts several records with a single multi-row INSERT ... VALUES (...), (...) statement,
+        so the whole batch costs one round-trip. Each value is a separate bind parameter and Postgres
+        allows at most 32767 per statement, so very large batches belong to bulk_copy instead.
+        Rows whose primary key already exists are skipped (ON CONFLICT DO NOTHING), which makes
+        retrying a batch safe. No refresh is performed, so every value needed later
+        (e.g. the 'time' key) must be set client-side.
+
+        Args:
+            rows (ListOfDataObjects): A list of dictionaries, one per record, matching the model's fields.
+            session (Optional[AsyncSession]): An already open session. When given, the insert joins the
+                                              caller's transaction and committing is left to the caller.
+                                              When omitted, a new session on the shared
+                                              connection and a new transaction are used.
+
+        Returns:
+            int: The number of rows actually inserted, duplicates excluded.
+
+        Raises:
+            Exception: If an error occurs during the database operation.
+        """
+        if not rows:
+            return 0
+
+        stmt = pg_insert(self.db_class).values(rows).on_conflict_do_nothing(
+            index_elements=[column.name for column in self.db_class.__table__.primary_key]
+        )
+        if session is not None:
+            result = await session.execute(stmt)
+            return result.rowcount
+
+        async with AppSession() as session:
+            try:
+                async with session.begin():
+                    result = await session.execute(stmt)
+                return result.rowcount
+            except Exception as e:
+                logger.error("Error bulk creating records for %s: %s", self.db_class.__name__, e)
+                raise
+
+    async def _copy_skipping_duplicates(self, session: AsyncSession, records: List[Tuple[Any, ...]],
+                                        columns: List[str]) -> int:
+        """
+        COPY has no ON CONFLICT clause, so the records are copied into a temporary staging table
+        dropped at commit, then moved over with INSERT ... SELECT ... ON CONFLICT (<primary key>) DO NOTHING.
+        Naming the primary key as the conflict target means a unique violation on any other
+        constraint still raises instead of silently dropping the record.
+        The COPY itself runs on the asyncpg connection underneath the session; the CREATE TEMP TABLE
+        executed through the session first makes sure the session's transaction is open on it.
+        Must run inside a transaction.
+        """
+        table_name = self.db_class.__tablename__
+        staging_name = f"_{table_name}_staging"
+        column_names = ", ".join(columns)
+        key_names = ", ".join(column.name for column in self.db_class.__table__.primary_key)
+        await session.execute(text(
+            f"CREATE TEMP TABLE {staging_name} (LIKE {table_name} INCLUDING DEFAULTS) ON COMMIT DROP"
+        ))
+        connection = await session.connection()
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(staging_name, records=records, columns=columns)
+        result = await session.execute(text(
+            f"INSERT INTO {table_name}({column_names}) SELECT {column_names} FROM {staging_name} "
+            f"ON CONFLICT ({key_names}) DO NOTHING"
+        ))
+        return result.rowcount
+
+    async def bulk_copy(self, records: List[Tuple[Any, ...]], columns: List[str],
+                        session: Optional[AsyncSession] = None) -> int:
+        """
+        Loads several records with a single binary COPY ... FROM STDIN on the shared app connection.
+        Meant for large batches, where it avoids the per-row parse/bind cost of INSERT.
+        Like bulk_create, records whose primary key already exists are skipped.
+
+        Args:
+            records (List[Tuple[Any, ...]]): The records to load, each value ordered as in `columns`.
+            columns (List[str]): The database column names the record values map to.
+            session (Optional[AsyncSession]): An already open session. When given, the copy joins the
+                                              caller's transaction and committing is left to the caller.
+                                              When omitted, a new session on the shared
+                                              connection and a new transaction are used.
+
+        Returns:
+            int: The number of records actually inserted, duplicates excluded.
+
+        Raises:
+            Exception: If an error occurs during the database operation.
+        """
+        if not records:
+            return 0
+
+        if session is not None:
+            return await self._copy_skipping_duplicates(session, records, columns)
+
+        async with AppSession() as session:
+            try:
+                async with session.begin():
+                    return await self._copy_skipping_duplicates(session, records, columns)
+            except Exception as e:
+                logger.error("Error copying records for %s: %s", self.db_class.__name__, e)
                 raise
@@ -1,40 +1,70 @@
 
 # database/engine.py
 
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, AsyncConnection
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from urllib.parse import urlparse
 import asyncpg
 import asyncio
+import datetime
+import logging
+import pathlib
+import re
+from typing import Iterable, List, Optional, Set, Tuple
 
 
 from database.models import Base
 
+logger = logging.getLogger(__name__)
+
 async_engine = None
+# Long-lived connection reused by every write; this process is a single writer
+app_conn = None
+# Written after the database has been checked/created once, so later starts skip that step
+DB_SENTINEL_PATH = pathlib.Path('.db_initialized')
+# Database names are interpolated into CREATE DATABASE, identifiers can't be bound as parameters
+_DB_NAME_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+# Mapped tables that really are partitioned in the database (tables created before
+# partitioning was introduced are left alone), and the monthly partitions known to exist
+partitioned_table_names: List[str] = []
+_ready_partitions: Set[Tuple[str, datetime.date]] = set()
+# Set as the comment of every mapped table once _prepare_schema has run on it, so a warm start
+# can skip the whole create/migrate step; bump it whenever the models, indexes or migrations change
+SCHEMA_VERSION = "pc_stats_logs schema 1"
 AsyncDBSession = sessionmaker(expire_on_commit=False, class_=AsyncSession)
 
-async def init_db(connection_string: str):
+def AppSession() -> AsyncSession:
     """
-    Initializes the asynchronous SQLAlchemy database engine and ensures
-    the database and all mapped tables exist.
+    Returns a session bound to the long-lived app_conn, skipping the pool checkout
+    that AsyncDBSession pays on every use. Only one such session may be active at a time.
     """
-    global async_engine
+    return AsyncSession(bind=app_conn, expire_on_commit=False)
 
-    print(f"DEBUG: init_db called with connection_string: {connection_string}") # Debug print
+def _db_sentinel_matches(db_target: str) -> bool:
+    """
+    Tells whether the sentinel file records an earlier successful bootstrap of `db_target`
+    ("host:port/name"), so that pointing CONN_STRING at another database still bootstraps it.
+    """
+    try:
+        return DB_SENTINEL_PATH.read_text() == db_target
+    except OSError:
+        return False
 
-    parsed_url = urlparse(connection_string)
-    db_user = parsed_url.username
-    db_password = parsed_url.password
-    db_host = parsed_url.hostname
-    db_port = parsed_url.port if parsed_url.port else 5432
-    db_name = parsed_url.path.lstrip('/')
+async def _ensure_database_exists(db_user: str, db_password: str, db_host: str, db_port: int, db_name: str):
+    """
+    Connects to the default 'postgres' database and creates `db_name` if it does not exist yet.
 
-    print(f"DEBUG: Parsed DB details - Host: {db_host}, Port: {db_port}, User: {db_user}, DB Name: {db_name}") # Debug print
+    Raises:
+        ValueError: If `db_name` is not a plain identifier and so can't be safely used in CREATE DATABASE.
+    """
+    if not _DB_NAME_PATTERN.match(db_name):
+        raise ValueError(f"Invalid database name '{db_name}': expected letters, digits and underscores only.")
 
     temp_conn = None
     try:
-        print(f"DEBUG: Attempting initial asyncpg.connect to 'postgres' database on {db_host}:{db_port}...") # Debug print
+        logger.debug("Attempting initial asyncpg.connect to 'postgres' database on %s:%s...", db_host, db_port)
         temp_conn = await asyncpg.connect(
             user=db_user,
             password=db_password,
@@ -42,43 +72,320 @@ async def init_db(connection_string: str):
             port=db_port,
             database='postgres' # Connect to default 'postgres' DB to check/create your target DB
         )
-        print("DEBUG: Successfully connected to 'postgres' database.") # Debug print
+        logger.debug("Successfully connected to 'postgres' database.")
 
-        db_exists_query = f"SELECT 1 FROM pg_database WHERE datname='{db_name}'"
-        print(f"DEBUG: Checking if database '{db_name}' exists...") # Debug print
-        db_exists = await temp_conn.fetchval(db_exists_query)
+        logger.debug("Checking if database '%s' exists...", db_name)
+        db_exists = await temp_conn.fetchval("SELECT 1 FROM pg_database WHERE datname=$1", db_name)
 
         if not db_exists:
-            print(f"Database '{db_name}' does not exist. Creating...")
+            logger.info("Database '%s' does not exist. Creating...", db_name)
             await temp_conn.execute(f'CREATE DATABASE "{db_name}"')
-            print(f"Database '{db_name}' created.")
+            logger.info("Database '%s' created.", db_name)
         else:
-            print(f"Database '{db_name}' already exists.")
+            logger.debug("Database '%s' already exists.", db_name)
 
     except asyncpg.exceptions.DuplicateDatabaseError:
-        print(f"Database '{db_name}' already exists (concurrent creation attempt).")
+        logger.info("Database '%s' already exists (concurrent creation attempt).", db_name)
     except Exception as e:
-        print(f"DEBUG: Error during initial database existence check/creation: {e}") # Debug print
+        logger.error("Error during initial database existence check/creation: %s", e)
         # import traceback
         # traceback.print_exc() # Uncomment for full traceback if needed
         raise # Re-raise the exception to ensure it's visible in the logs
     finally:
         if temp_conn:
-            print("DEBUG: Closing temporary connection to 'postgres' database.") # Debug print
+            logger.debug("Closing temporary connection to 'postgres' database.")
             await temp_conn.close()
 
+async def _bootstrap_database(db_user: str, db_password: str, db_host: str, db_port: int, db_name: str,
+                              db_target: str):
+    """
+    Makes sure the target database exists, then records it in the sentinel file.
+    """
+    await _ensure_database_exists(db_user, db_password, db_host, db_port, db_name)
+    try:
+        DB_SENTINEL_PATH.write_text(db_target)
+    except OSError as e:
+        logger.warning("Could not write %s, the check will run again next start: %s", DB_SENTINEL_PATH, e)
+
+def _is_missing_database_error(error: BaseException) -> bool:
+    """
+    Tells whether `error`, or the driver error SQLAlchemy wrapped into it, reports a database that doesn't exist.
+    """
+    while error is not None:
+        if isinstance(error, asyncpg.exceptions.InvalidCatalogNameError):
+            return True
+        error = getattr(error, 'orig', None) or error.__cause__
+    return False
+
+async def _relation_exists(conn: AsyncConnection, relation_name: str) -> bool:
+    """
+    Probes a table or index with to_regclass, one cheap catalog lookup
+    instead of the reflection queries create_all runs.
+    """
+    return await conn.scalar(text("SELECT to_regclass(:relation_name)"), {"relation_name": relation_name}) is not None
+
+async def _create_missing_indexes(conn: AsyncConnection):
+    """
+    Creates the mapped indexes missing from tables that already existed,
+    since create_all only adds indexes together with new tables.
+    """
+    for table in Base.metadata.tables.values():
+        for index in table.indexes:
+            if not await _relation_exists(conn, index.name):
+                logger.info("Creating missing index '%s'...", index.name)
+                await conn.run_sync(index.create)
+
+async def _migrate_primary_keys(conn: AsyncConnection):
+    """
+    Compares the primary key of every mapped table with the one in the database.
+    Tables created by older versions keyed gpu_stats on 'time' alone: a key made of a subset
+    of the mapped columns is widened in place (the existing rows are already unique on it).
+    Any other mismatch stops start-up, since inserts would otherwise target a key that doesn't exist.
+
+    Raises:
+        RuntimeError: If a table has no primary key or one that can't be widened to the mapped key.
+    """
+    for table in Base.metadata.tables.values():
+        expected = [column.name for column in table.primary_key.columns]
+        row = (await conn.execute(
+            text(
+                "SELECT c.conname, array_agg(a.attname::text) FROM pg_constraint c "
+                "JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = ANY(c.conkey) "
+                "WHERE c.conrelid = to_regclass(:table_name) AND c.contype = 'p' GROUP BY c.conname"
+            ),
+            {"table_name": table.name}
+        )).first()
+        actual = set(row[1]) if row else set()
+        if actual == set(expected):
+            continue
+        if not actual or not actual < set(expected):
+            raise RuntimeError(
+                f"Table '{table.name}' has primary key {sorted(actual)} but the model expects {expected}. "
+                f"Migrate or recreate the table before starting."
+            )
+        logger.info("Widening primary key of '%s' from %s to %s...", table.name, sorted(actual), expected)
+        await conn.execute(text(
+            f'ALTER TABLE {table.name} DROP CONSTRAINT "{row[0]}", ADD PRIMARY KEY ({", ".join(expected)})'
+        ))
+
+# Older versions stored the network counters as float megabytes (bytes / 1024**2)
+_MEGABYTE_COLUMNS = {"pc_stats": ("internet_receive", "internet_sent")}
+
+async def _migrate_network_columns(conn: AsyncConnection):
+    """
+    Converts network columns still stored as float megabytes to the mapped BIGINT byte counters,
+    scaling the existing values back to bytes. The ALTER rewrites the table, once.
+
+    Raises:
+        RuntimeError: If a network column has any other type, so bytes are never written into it.
+    """
+    for table_name, column_names in _MEGABYTE_COLUMNS.items():
+        for column_name in column_names:
+            column_type = await conn.scalar(
+                text(
+                    "SELECT format_type(a.atttypid, a.atttypmod) FROM pg_attribute a "
+                    "WHERE a.attrelid = to_regclass(:table_name) AND a.attname = :column_name AND NOT a.attisdropped"
+                ),
+                {"table_name": table_name, "column_name": column_name}
+            )
+            if column_type == "bigint":
+                continue
+            if column_type != "double precision":
+                raise RuntimeError(
+                    f"Column '{table_name}.{column_name}' has type {column_type} but the model expects bigint. "
+                    f"Migrate or recreate the table before starting."
+                )
+            logger.info("Converting '%s.%s' from megabytes to BIGINT bytes...", table_name, column_name)
+            await conn.execute(text(
+                f"ALTER TABLE {table_name} ALTER COLUMN {column_name} TYPE BIGINT "
+                f"USING ({column_name} * 1048576)::bigint"
+            ))
+
+def _month_start(moment: datetime.datetime) -> datetime.date:
+    """Returns the first day of the month `moment` falls in, the lower bound of its partition."""
+    return datetime.date(moment.year, moment.month, 1)
+
+def _next_month(month: datetime.date) -> datetime.date:
+    """Returns the first day of the month after `month`, the upper bound of its partition."""
+    return datetime.date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+async def _find_partitioned_tables(conn: AsyncConnection) -> List[str]:
+    """
+    Returns the mapped tables declared with postgresql_partition_by that are partitioned in the database.
+    """
+    table_names = []
+    for table in Base.metadata.tables.values():
+        if not table.dialect_options['postgresql'].get('partition_by'):
+            continue
+        is_partitioned = await conn.scalar(
+            text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table_name)"),
+            {"table_name": table.name}
+        )
+        if is_partitioned:
+            table_names.append(table.name)
+        else:
+            logger.debug("Table '%s' was created unpartitioned, skipping its partitions.", table.name)
+    return table_names
+
+async def _create_month_partitions(conn: AsyncConnection,
+                                   months: Iterable[datetime.date]) -> List[Tuple[str, datetime.date]]:
+    """
+    Creates the monthly partition of every partitioned table for each of `months`, if not there yet.
+    Returns the (table, month) pairs it handled; the caller adds them to _ready_partitions only once
+    its transaction has committed, so a rolled back partition is retried on the next insert.
+    """
+    handled = []
+    for table_name in partitioned_table_names:
+        for month in months:
+            if (table_name, month) in _ready_partitions:
+                continue
+            partition_name = f"{table_name}_y{month.year}m{month.month:02d}"
+            await conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {partition_name} PARTITION OF {table_name} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_next_month(month).isoformat()}')"
+            ))
+            handled.append((table_name, month))
+    return handled
+
+async def ensure_partitions(times: Iterable[datetime.datetime]):
+    """
+    Makes sure a monthly partition exists for each of `times`, so rows about to be inserted
+    always have a partition to land in. Months already handled by this process cost no query.
+
+    Args:
+        times (Iterable[datetime.datetime]): The 'time' values of the rows about to be inserted.
+    """
+    months = {_month_start(moment) for moment in times}
+    missing = [month for month in months
+               if any((table_name, month) not in _ready_partitions for table_name in partitioned_table_names)]
+    if not missing:
+        return
+    # Own transaction on the shared connection, so a failed data insert can't roll back a partition
+    # this process already recorded as created
+    async with AppSession() as session:
+        async with session.begin():
+            created = await _create_month_partitions(await session.connection(), sorted(missing))
+    _ready_partitions.update(created)
+
+async def _prepare_schema(conn: AsyncConnection) -> List[Tuple[str, datetime.date]]:
+    """
+    Creates or migrates the mapped tables and their indexes, and the current and next month's partitions,
+    then marks the tables with SCHEMA_VERSION. Returns the partitions created, see _create_month_partitions.
+    """
+    await conn.run_sync(Base.metadata.create_all)
+    logger.debug("Database tables checked/created.")
+    # Also covers tables that already existed when create_all filled in the missing ones
+    await _create_missing_indexes(conn)
+    await _migrate_primary_keys(conn)
+    await _migrate_network_columns(conn)
+
+    # The current and the next month are created up front, later ones on demand by ensure_partitions
+    partitioned_table_names[:] = await _find_partitioned_tables(conn)
+    current_month = _month_start(datetime.datetime.now())
+    created = await _create_month_partitions(conn, [current_month, _next_month(current_month)])
+
+    for table_name in Base.metadata.tables:
+        await conn.execute(text(f"COMMENT ON TABLE {table_name} IS '{SCHEMA_VERSION}'"))
+    return created
+
+async def _read_prepared_schema(conn: AsyncConnection) -> Optional[List[str]]:
+    """
+    The warm-start check, a single catalog query: when every mapped table exists and is marked with
+    SCHEMA_VERSION, returns the ones that are partitioned in the database; otherwise returns None.
+    """
+    rows = (await conn.execute(
+        text(
+            "SELECT c.relname, c.relkind = 'p' FROM pg_class c "
+            "WHERE c.oid = ANY(SELECT to_regclass(name) FROM unnest(CAST(:table_names AS text[])) AS name) "
+            "AND obj_description(c.oid, 'pg_class') = :schema_version"
+        ),
+        {"table_names": list(Base.metadata.tables), "schema_version": SCHEMA_VERSION}
+    )).all()
+    if len(rows) != len(Base.metadata.tables):
+        return None
+    return [table_name for table_name, is_partitioned in rows if is_partitioned]
+
+async def _ensure_schema(conn: AsyncConnection) -> List[Tuple[str, datetime.date]]:
+    """
+    Runs _prepare_schema unless the tables are already marked with the current SCHEMA_VERSION.
+    On a warm start no partition is created here; ensure_partitions adds them before the first insert.
+    Returns the partitions created, see _create_month_partitions.
+    """
+    prepared_partitioned_tables = await _read_prepared_schema(conn)
+    if prepared_partitioned_tables is None:
+        return await _prepare_schema(conn)
+    logger.debug("Database schema already at '%s', skipping create_all and migrations.", SCHEMA_VERSION)
+    partitioned_table_names[:] = prepared_partitioned_tables
+    return []
+
+async def init_db(connection_string: str):
+    """
+    Initializes the asynchronous SQLAlchemy database engine and ensures
+    the database and all mapped tables exist.
+    """
+    global async_engine, app_conn
+
+    parsed_url = urlparse(connection_string)
+    db_user = parsed_url.username
+    db_password = parsed_url.password
+    db_host = parsed_url.hostname
+    db_port = parsed_url.port if parsed_url.port else 5432
+    db_name = parsed_url.path.lstrip('/')
+
+    # The password is never logged: the connection string is only ever reported by its parts below
+    logger.debug("Parsed DB details - Host: %s, Port: %s, User: %s, DB Name: %s", db_host, db_port, db_user, db_name)
+
+    # Checking/creating the database needs an extra connection to 'postgres'; skip it once it has succeeded
+    db_target = f"{db_host}:{db_port}/{db_name}"
+    skipped_bootstrap = _db_sentinel_matches(db_target)
+    if skipped_bootstrap:
+        logger.debug("Database '%s' already bootstrapped (%s found), skipping existence check.", db_name, DB_SENTINEL_PATH)
+    else:
+        await _bootstrap_database(db_user, db_password, db_host, db_port, db_name, db_target)
+
     # Ensure connection_string uses 'postgresql+asyncpg' for SQLAlchemy
     if not connection_string.startswith("postgresql+asyncpg://"):
-        print("DEBUG: Adjusting connection string to use 'postgresql+asyncpg'...") # Debug print
+        logger.debug("Adjusting connection string to use 'postgresql+asyncpg'...")
         connection_string = connection_string.replace("postgresql://", "postgresql+asyncpg://", 1)
 
-    print(f"DEBUG: Creating SQLAlchemy async engine with final connection string: {connection_string}") # Debug print
-    async_engine = create_async_engine(connection_string, echo=False) # echo=True for SQL logging
+    logger.debug("Creating SQLAlchemy async engine for %s:%s/%s...", db_host, db_port, db_name)
+    # Small fixed-size pool: one connection is held by app_conn, one is left for ad-hoc AsyncDBSession use
+    async_engine = create_async_engine(
+        connection_string,
+        echo=False, # echo=True for SQL logging
+        pool_size=2,
+        max_overflow=0,
+        pool_pre_ping=False
+    )
 
-    print("DEBUG: Beginning transaction to ensure database tables exist...") # Debug print
-    async with async_engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-        print("DEBUG: Database tables checked/created.") # Debug print
+    logger.debug("Beginning transaction to ensure database tables exist...")
+    try:
+        async with async_engine.begin() as conn:
+            created_partitions = await _ensure_schema(conn)
+    except Exception as e:
+        # The sentinel outlives the database (e.g. a fresh Postgres volume): bootstrap again, once
+        if not (skipped_bootstrap and _is_missing_database_error(e)):
+            raise
+        logger.warning("Database '%s' is gone although %s records it, bootstrapping it again...", db_name, DB_SENTINEL_PATH)
+        DB_SENTINEL_PATH.unlink(missing_ok=True)
+        await _bootstrap_database(db_user, db_password, db_host, db_port, db_name, db_target)
+        async with async_engine.begin() as conn:
+            created_partitions = await _ensure_schema(conn)
+    _ready_partitions.update(created_partitions)
 
     AsyncDBSession.configure(bind=async_engine)
-    print("DEBUG: Asynchronous database initialization complete.") # Debug print
+    app_conn = await async_engine.connect()
+    logger.info("Asynchronous database initialization complete.")
+
+async def close_db():
+    """
+    Closes the long-lived app connection and disposes of the engine's pool.
+    Safe to call when init_db never ran or failed half-way.
+    """
+    global app_conn
+    if app_conn is not None:
+        await app_conn.close()
+        app_conn = None
+    if async_engine is not None:
+        await async_engine.dispose()
+    logger.debug("Database connections closed.")
\ No newline at end of file
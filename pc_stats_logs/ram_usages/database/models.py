@@ -1,7 +1,7 @@
 # database/models.py
 from typing import Any
 import datetime
-from sqlalchemy import Column, ForeignKey, Integer, String, Float, BigInteger, Table, DateTime
+from sqlalchemy import Column, ForeignKey, Integer, String, Float, BigInteger, Table, DateTime, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.types import Boolean
@@ -18,8 +18,16 @@ def to_dict(obj: Base) -> dict[str, Any]:
     # Corrected: Use c.key (Python attribute name) instead of c.name (database column name)
     return {c.key: getattr(obj, c.key) for c in obj.__table__.columns}
 
+# Rows are appended in time order, so a BRIN index on 'time' stays tiny and nearly free to
+# maintain on insert while still serving time-range queries; the primary key B-tree is kept as is.
+# Both tables are range-partitioned by 'time' into monthly partitions (see database.engine.ensure_partitions),
+# so inserts only ever touch the small current partition and its indexes.
 class PcStats(Base):
     __tablename__ = "pc_stats"
+    __table_args__ = (
+        Index('ix_pc_stats_time_brin', 'time', postgresql_using='brin'),
+        {'postgresql_partition_by': 'RANGE (time)'},
+    )
     time = Column('time',DateTime, primary_key=True, default=datetime.datetime.now)
     pc_usage = Column('pc_usage',Float, nullable = True)
     pc_freq = Column('pc_freq',Float, nullable = True)
@@ -27,13 +35,21 @@ class PcStats(Base):
     ram_usage = Column('ram_usage', Float, nullable = True)
     ram_available = Column('ram_available', Float, nullable = True)
     
-    internet_receive = Column('internet_receive', Float, nullable = True)
-    internet_sent = Column('internet_sent', Float, nullable=True)
+    # Raw cumulative byte counters from psutil; rates are derived on read, e.g.
+    # (internet_receive - LAG(internet_receive) OVER (ORDER BY time))
+    #     / EXTRACT(EPOCH FROM time - LAG(time) OVER (ORDER BY time)) / 1024^2  -> MB/s
+    internet_receive = Column('internet_receive', BigInteger, nullable = True)
+    internet_sent = Column('internet_sent', BigInteger, nullable=True)
 
 class GpuStats(Base):
     __tablename__ = "gpu_stats"
+    __table_args__ = (
+        Index('ix_gpu_stats_time_brin', 'time', postgresql_using='brin'),
+        {'postgresql_partition_by': 'RANGE (time)'},
+    )
     time = Column('time',DateTime, primary_key=True, default=datetime.datetime.now)
-    gpu_id = Column('gpu_id',Integer, nullable = False)
+    # Part of the key: every GPU row of one tick shares the same timestamp
+    gpu_id = Column('gpu_id',Integer, primary_key=True, nullable = False)
     ram_usage = Column('ram_usage', Float, nullable = True)
     ram_available = Column('ram_available', Float, nullable = True)
     temp = Column('temp', Float, nullable = True)
\ No newline at end of file
@@ -1,63 +1,149 @@
 import os
 import asyncio
+import logging
+import signal
 import time
 from dotenv import load_dotenv
 import sys
+from typing import Any, Dict, List, Optional
 
-from operations.stats_monitor import get_pc_stats, insert_stats_to_db
-from database.engine import init_db
+from operations.stats_monitor import get_pc_stats, init_stats_monitor, insert_stats_to_db, stats_changed
+from database.engine import close_db, init_db
 
-async def gather_stats_pipeline():
+logger = logging.getLogger(__name__)
+
+def configure_logging() -> None:
+    """
+    Sends log records to stdout. The level comes from the LOG_LEVEL environment variable
+    and defaults to INFO, so the per-tick DEBUG records are only formatted and written when asked for.
+    An unknown LOG_LEVEL falls back to INFO instead of failing at startup.
     """
-    Gathers PC and GPU statistics and inserts them into the database.
+    level_name = os.getenv("LOG_LEVEL", "INFO").upper()
+    # getLevelName returns the numeric level for known names and a "Level ..." string otherwise
+    level_is_valid = isinstance(logging.getLevelName(level_name), int)
+    logging.basicConfig(
+        stream=sys.stdout,
+        level=level_name if level_is_valid else logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+    )
+    if not level_is_valid:
+        logger.warning("Unknown LOG_LEVEL '%s', falling back to INFO.", level_name)
+
+async def gather_stats_pipeline() -> Optional[List[Dict[str, Any]]]:
+    """
+    Gathers PC and GPU statistics for one sample.
+    Sampling runs in a worker thread, so the blocking psutil/NVML calls don't stall the event loop.
     Handles errors gracefully.
+
+    Returns:
+        Optional[List[Dict[str, Any]]]: The rows of the sample, or None if nothing could be gathered.
     """
     try:
-        stats_list = get_pc_stats()
+        stats_list = await asyncio.to_thread(get_pc_stats)
         if stats_list:
-            await insert_stats_to_db(stats_list)
-        else:
-            print("Failed to gather stats. No data to insert.")
-            sys.stdout.flush() # Ensure print is visible immediately
+            return stats_list
+        logger.warning("Failed to gather stats. No data to insert.")
     except Exception as e:
-        print(f"An error occurred during the stats gathering pipeline: {e}")
-        sys.stdout.flush() # Ensure print is visible immediately
+        logger.error("An error occurred during the stats gathering pipeline: %s", e)
         # import traceback
         # traceback.print_exc()
+    return None
+
+
+async def flush_stats_buffer(stats_buffer: List[Dict[str, Any]]) -> None:
+    """
+    Inserts every buffered row in one call and empties the buffer.
+    If the insert fails the rows are kept, so the next flush retries them.
+
+    Args:
+        stats_buffer (List[Dict[str, Any]]): The rows collected since the last flush.
+    """
+    if not stats_buffer:
+        return
+    try:
+        await insert_stats_to_db(stats_buffer)
+        stats_buffer.clear()
+    except Exception as e:
+        logger.error("An error occurred while flushing %d buffered stats rows: %s", len(stats_buffer), e)
+
 
+def _cancel_on_sigterm() -> None:
+    """
+    Turns SIGTERM (sent by `docker stop` and on every container restart) into a cancellation
+    of the running task, so the buffered samples get the same final flush as on Ctrl+C.
+    """
+    main_task = asyncio.current_task()
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, main_task.cancel)
+    except NotImplementedError:
+        # Event loops on Windows don't support signal handlers
+        logger.debug("SIGTERM handler not supported on this platform.")
 
-async def main_loop(interval_seconds: int = 10):
+
+async def main_loop(interval_seconds: int = 10, batch_size: int = 60, max_interval_seconds: int = 60):
     """
     Main loop to run the stats.
+    Samples are buffered in memory and written to the database once every `batch_size` samples,
+    or once the oldest buffered sample has waited `batch_size * interval_seconds`,
+    and once more when the loop is cancelled (Ctrl+C or SIGTERM) so no sample is lost.
+    While the stats stay flat, samples are dropped and the interval backs off by 1.5x up to
+    `max_interval_seconds`; the first sample that changes resets it to `interval_seconds`.
 
     Args:
-        interval_seconds (int): The time interval (in seconds) between each run.
+        interval_seconds (int): The base time interval (in seconds) between each run.
+        batch_size (int): The number of samples to buffer before flushing them to the database.
+        max_interval_seconds (int): The longest interval (in seconds) reached while backing off.
     """
     load_dotenv('.env')
+    configure_logging()
     conn_string = os.getenv("CONN_STRING")
 
     if not conn_string:
-        print("ERROR: CONN_STRING is not set in the environment. Cannot proceed.")
+        logger.error("CONN_STRING is not set in the environment. Cannot proceed.")
         return
 
+    _cancel_on_sigterm()
+    stats_buffer: List[Dict[str, Any]] = []
+    samples_buffered = 0
+    last_kept_sample: Optional[List[Dict[str, Any]]] = None
+    sleep_seconds = interval_seconds
+    max_flush_delay = batch_size * interval_seconds
+    first_buffered_at = 0.0
     try:
-        print("DEBUG: Calling init_db...")
-        sys.stdout.flush() # Ensure print is visible immediately
+        # Primed before init_db so cpu_percent has a real window behind the first sample
+        init_stats_monitor()
+        logger.debug("Calling init_db...")
         await init_db(conn_string)
-        print("DEBUG: init_db completed successfully.")
-        sys.stdout.flush() # Ensure print is visible immediately
+        logger.debug("init_db completed successfully.")
 
         while True:
-            await gather_stats_pipeline()
-            await asyncio.sleep(interval_seconds)
+            stats_list = await gather_stats_pipeline()
+            if stats_list is not None:
+                if last_kept_sample is not None and not stats_changed(last_kept_sample, stats_list):
+                    sleep_seconds = min(sleep_seconds * 1.5, max_interval_seconds)
+                    logger.debug("Stats unchanged, skipping sample. Next sample in %.1fs.", sleep_seconds)
+                else:
+                    if not samples_buffered:
+                        first_buffered_at = time.monotonic()
+                    stats_buffer.extend(stats_list)
+                    samples_buffered += 1
+                    last_kept_sample = stats_list
+                    sleep_seconds = interval_seconds
+
+            if samples_buffered >= batch_size or (
+                    samples_buffered and time.monotonic() - first_buffered_at >= max_flush_delay):
+                await flush_stats_buffer(stats_buffer)
+                samples_buffered = 0
+            await asyncio.sleep(sleep_seconds)
     except asyncio.CancelledError:
-        print("\nPC Stats monitoring stopped by user.")
-        sys.stdout.flush() # Ensure print is visible immediately
+        logger.info("PC Stats monitoring stopped. Flushing buffered stats...")
+        await flush_stats_buffer(stats_buffer)
     except Exception as e:
-        print(f"\nAn unexpected error occurred in the main loop: {e}")
-        sys.stdout.flush() # Ensure print is visible immediately
+        logger.error("An unexpected error occurred in the main loop: %s", e)
         # import traceback
         # traceback.print_exc()
+    finally:
+        await close_db()
 
 if __name__ == "__main__":
     asyncio.run(main_loop(10))
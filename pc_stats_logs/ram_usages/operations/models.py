@@ -1,17 +1,21 @@
 # operations.models.py
 
-from typing import Optional, List
-from pydantic import BaseModel
+import datetime
+from typing import Optional, TypedDict
 
-class PcStatsCreateData(BaseModel):
-    pc_usage: Optional[float] = None
-    pc_freq: Optional[float] = None
-    ram_usage: Optional[float] = None
-    ram_available: Optional[float] = None
-    internet_receive: Optional[float] = None
-    internet_sent: Optional[float] = None
-class GpuStatsCreateData(BaseModel):
-    gpu_id:int
-    ram_usage: Optional[float] = None
-    ram_available: Optional[float] = None
-    temp: Optional[float] = None
\ No newline at end of file
+# Plain dictionaries with a declared shape: the rows are built by get_pc_stats itself
+# from psutil/NVML values, so they are type-checked statically instead of validated per tick.
+class PcStatsCreateData(TypedDict):
+    time: datetime.datetime
+    pc_usage: Optional[float]
+    pc_freq: Optional[float]
+    ram_usage: Optional[float]
+    ram_available: Optional[float]
+    internet_receive: Optional[int]
+    internet_sent: Optional[int]
+class GpuStatsCreateData(TypedDict):
+    time: datetime.datetime
+    gpu_id: int
+    ram_usage: Optional[float]
+    ram_available: Optional[float]
+    temp: Optional[float]
\ No newline at end of file
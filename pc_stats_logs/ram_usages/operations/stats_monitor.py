@@ -1,30 +1,94 @@
+import datetime
 import psutil
-import GPUtil
+import pynvml
 from typing import Dict, List, Optional, Union, Any
 from database.db_interface import DBInterface
+from database import engine as db_engine
+from database.engine import AppSession
+from sqlalchemy.ext.asyncio import AsyncSession
 from database.models import PcStats, GpuStats
 from operations.models import PcStatsCreateData, GpuStatsCreateData
-import sys
+import logging
+
+logger = logging.getLogger(__name__)
 
 gpu_interface = DBInterface(GpuStats)
 pc_interface = DBInterface(PcStats)
 
-def get_pc_stats() -> Optional[List[Dict[str, Union[float, int, None]]]]:
+# Postgres allows at most this many bind parameters per statement; a table whose rows
+# would need more in a single multi-row INSERT is loaded with COPY instead
+MAX_INSERT_PARAMS = 32767
+
+# Smallest absolute change per field that makes a new sample worth storing.
+# The network counters are cumulative and always grow, so they are not compared.
+PC_CHANGE_THRESHOLDS = {'pc_usage': 1.0, 'ram_usage': 0.1, 'ram_available': 0.1} # %, GB, GB
+GPU_CHANGE_THRESHOLDS = {'ram_usage': 50.0, 'ram_available': 50.0, 'temp': 1.0} # MB, MB, Celsius
+
+# None until init_stats_monitor has run, then whether NVML could be initialized
+_nvml_ready: Optional[bool] = None
+
+PC_COLUMNS = [c.name for c in PcStats.__table__.columns]
+GPU_COLUMNS = [c.name for c in GpuStats.__table__.columns]
+
+def _to_records(rows: List[Dict[str, Any]], columns: List[str]) -> List[tuple]:
+    """
+    Converts row dictionaries into tuples ordered as `columns`, the shape expected by COPY.
+    Missing keys become None.
     """
-    Gathers general PC and GPU statistics, validates both PC and GPU stats with Pydantic,
-    and returns them as a single list of dictionaries suitable for direct database insertion.
+    return [tuple(row.get(column) for column in columns) for row in rows]
+
+async def _write_rows(interface: DBInterface, session: AsyncSession, rows: List[Dict[str, Any]],
+                      columns: List[str]) -> int:
+    """
+    Writes one table's rows inside the caller's transaction: a single multi-row INSERT while
+    the rows fit in MAX_INSERT_PARAMS bind parameters, binary COPY beyond that.
+    Returns the number of rows actually inserted.
+    """
+    if len(rows) * len(columns) > MAX_INSERT_PARAMS:
+        logger.debug("Attempting to copy %d %s rows...", len(rows), interface.db_class.__tablename__)
+        return await interface.bulk_copy(_to_records(rows, columns), columns, session=session)
+    logger.debug("Attempting to insert %d %s rows...", len(rows), interface.db_class.__tablename__)
+    return await interface.bulk_create(rows, session=session)
+
+def init_stats_monitor() -> None:
+    """
+    Prepares the samplers once per process: initializes NVML for the GPU stats
+    and primes psutil.cpu_percent, whose first non-blocking call always returns a meaningless 0.0.
+    Call it well before the first sample, since cpu_percent measures from the priming call.
+    Safe to call more than once; get_pc_stats calls it on first use if needed.
+    """
+    global _nvml_ready
+    if _nvml_ready is not None:
+        return
+
+    psutil.cpu_percent(interval=None)
+    try:
+        pynvml.nvmlInit()
+        _nvml_ready = True
+        logger.debug("NVML initialized for GPU stats collection.")
+    except Exception as nvml_e:
+        _nvml_ready = False
+        logger.warning("Could not initialize NVML, GPU stats will be skipped (no NVIDIA driver or GPU detected): %s", nvml_e)
+
+def get_pc_stats() -> Optional[List[Union[PcStatsCreateData, GpuStatsCreateData]]]:
+    """
+    Gathers general PC and GPU statistics and returns them as a single list
+    of dictionaries suitable for direct database insertion.
 
     Returns:
             A list where:
-            - The first element is a dictionary containing PC statistics (validated by PcStatsCreateData).
-            - Subsequent elements are dictionaries for each detected GPU (validated by GpustatsCreateData).
+            - The first element is a dictionary containing PC statistics (shaped as PcStatsCreateData).
+            - Subsequent elements are dictionaries for each detected GPU (shaped as GpuStatsCreateData).
             Returns None if a critical error occurs during data collection.
     """
+    init_stats_monitor()
+
+    # Every row of this tick shares the collection time, which is also the primary key
+    collected_at = datetime.datetime.now()
     pc_data_dict = {}
     gpu_data_list = []
 
-    print("... Starting get_pc_stats...")
-    sys.stdout.flush()
+    logger.debug("Starting get_pc_stats...")
 
     try:
         # --- Collect CPU Stats ---
@@ -39,113 +103,123 @@ def get_pc_stats() -> Optional[List[Dict[str, Union[float, int, None]]]]:
 
         # --- Collect Network I/O Stats ---
         net_io = psutil.net_io_counters()
-        pc_data_dict['internet_receive'] = round(net_io.bytes_recv / (1024**2), 2) # Received MB
-        pc_data_dict['internet_sent'] = round(net_io.bytes_sent / (1024**2), 2) # Sent MB
+        pc_data_dict['internet_receive'] = net_io.bytes_recv # Received bytes since boot
+        pc_data_dict['internet_sent'] = net_io.bytes_sent # Sent bytes since boot
 
-        # Validate with PcStatsCreateData (validation only)
-        _ = PcStatsCreateData(**pc_data_dict)
-        print(f"DEBUG: PC stats collected and validated: {pc_data_dict}")
-        sys.stdout.flush()
+        logger.debug("PC stats collected: %s", pc_data_dict)
 
-        # --- Collect GPU Stats using GPUtil ---
+        # --- Collect GPU Stats using NVML ---
         try:
-            print("DEBUG: Attempting to retrieve GPU stats using GPUtil...")
-            sys.stdout.flush()
-            gpus = GPUtil.getGPUs()
-            print(f"DEBUG: GPUtil found {len(gpus)} GPUs.")
-            sys.stdout.flush()
+            gpu_count = pynvml.nvmlDeviceGetCount() if _nvml_ready else 0
+            logger.debug("NVML found %d GPUs.", gpu_count)
 
-            if not gpus:
-                print("DEBUG: No GPUs detected by GPUtil. Skipping GPU stats collection.")
-                sys.stdout.flush()
+            if not gpu_count:
+                logger.debug("No GPUs detected by NVML. Skipping GPU stats collection.")
 
-            for gpu in gpus:
+            for gpu_id in range(gpu_count):
+                handle = pynvml.nvmlDeviceGetHandleByIndex(gpu_id)
+                memory_info = pynvml.nvmlDeviceGetMemoryInfo(handle)
                 gpu_dict = {
-                    'gpu_id': gpu.id,
-                    'ram_usage': round(gpu.memoryUsed, 2), # GPU memory used in MB
-                    'ram_available': round(gpu.memoryFree, 2), # GPU memory free in MB
-                    'temp': round(gpu.temperature, 2) # GPU temperature in Celsius
+                    'time': collected_at,
+                    'gpu_id': gpu_id,
+                    'ram_usage': round(memory_info.used / (1024**2), 2), # GPU memory used in MB
+                    'ram_available': round(memory_info.free / (1024**2), 2), # GPU memory free in MB
+                    'temp': float(pynvml.nvmlDeviceGetTemperature(handle, pynvml.NVML_TEMPERATURE_GPU)) # GPU temperature in Celsius
                 }
-                # Validate with GpuStatsCreateData (validation only)
-                _ = GpuStatsCreateData(**gpu_dict)
                 gpu_data_list.append(gpu_dict)
-                print(f"DEBUG: GPU stats collected and validated for GPU ID {gpu.id}: {gpu_dict}")
-                sys.stdout.flush()
+                logger.debug("GPU stats collected for GPU ID %d: %s", gpu_id, gpu_dict)
 
         except Exception as gpu_e:
-            print(f"WARNING: Could not retrieve GPU stats (GPUtil might not be installed or compatible, or no GPU detected): {gpu_e}")
-            sys.stdout.flush()
+            logger.warning("Could not retrieve GPU stats from NVML: %s", gpu_e)
             # gpu_data_list will remain empty if an error occurs, which is handled gracefully.
 
         # Return a single list with pc_data_dict as the first element, followed by each gpu_dict
+        pc_data_dict['time'] = collected_at
         all_stats = [pc_data_dict] + gpu_data_list
-        print(f"DEBUG: get_pc_stats returning: {all_stats}")
-        sys.stdout.flush()
+        logger.debug("get_pc_stats returning: %s", all_stats)
         return all_stats
 
     except Exception as e:
-        print(f"ERROR: An error occurred while gathering PC stats: {e}")
-        sys.stdout.flush()
-        # import traceback
-        # traceback.print_exc() # Uncomment for full traceback if needed
+        logger.error("An error occurred while gathering PC stats: %s", e)
         return None # Return None if a critical error prevents data collection
 
-async def insert_stats_to_db(stats_list: List[Dict[str, Union[float, int, None]]]) -> None:
+def _row_changed(previous: Dict[str, Any], current: Dict[str, Any], thresholds: Dict[str, float]) -> bool:
+    """
+    Tells whether any thresholded field moved by at least its threshold between two rows.
+    A field that is None in either row counts as changed only if the other one is not None.
+    """
+    for field, threshold in thresholds.items():
+        old_value, new_value = previous.get(field), current.get(field)
+        if old_value is None or new_value is None:
+            if old_value is not new_value:
+                return True
+        elif abs(new_value - old_value) >= threshold:
+            return True
+    return False
+
+def stats_changed(previous: List[Dict[str, Any]], current: List[Dict[str, Any]]) -> bool:
+    """
+    Compares two samples as returned by get_pc_stats and tells whether the newer one
+    differs enough from the older one to be stored. A different set of GPUs always counts as a change.
+
+    Args:
+        previous (List[Dict[str, Any]]): The last sample that was kept.
+        current (List[Dict[str, Any]]): The sample just collected.
+
+    Returns:
+        bool: True if at least one PC or GPU field moved by its threshold or more.
+    """
+    previous_gpus = {row['gpu_id']: row for row in previous if 'gpu_id' in row}
+    current_gpus = {row['gpu_id']: row for row in current if 'gpu_id' in row}
+    if previous_gpus.keys() != current_gpus.keys():
+        return True
+    if _row_changed(previous[0], current[0], PC_CHANGE_THRESHOLDS):
+        return True
+    return any(_row_changed(previous_gpus[gpu_id], row, GPU_CHANGE_THRESHOLDS)
+               for gpu_id, row in current_gpus.items())
+
+async def insert_stats_to_db(stats_list: List[Dict[str, Union[float, int, datetime.datetime, None]]]) -> None:
     """
     Inserts PC and GPU statistics from a list into the database.
+    Both tables are written inside a single transaction with one bulk statement per table,
+    so a batch is either stored completely or not at all. Each table gets a multi-row INSERT,
+    or binary COPY when its rows are too many for one INSERT (see _write_rows).
     This function will now raise any exceptions encountered during database insertion.
 
     Args:
-        stats_list (List[Dict[str, Union[float, int, None]]]):
-            A list where:
-            - The first element is a dictionary containing PC statistics.
-            - Subsequent elements are dictionaries for each detected GPU.
+        stats_list (List[Dict[str, Union[float, int, datetime.datetime, None]]]):
+            The rows of one or more ticks as returned by get_pc_stats, concatenated.
+            Dictionaries with a 'gpu_id' key are GPU statistics, the others PC statistics.
+            Each row should carry the 'time' it was collected at; rows without one get the current time.
     """
-    print(f"DEBUG: insert_stats_to_db called with {len(stats_list)} items.")
-    sys.stdout.flush()
+    logger.debug("insert_stats_to_db called with %d items.", len(stats_list))
 
     if not stats_list:
-        print("No stats to insert.")
-        sys.stdout.flush()
+        logger.info("No stats to insert.")
         return
 
-    pc_stats_inserted_count = 0
-    gpu_stats_inserted_count = 0
+    # The 'time' primary key is known client-side, so it never has to be read back with a refresh
+    fallback_time = datetime.datetime.now()
+    pc_rows = []
+    gpu_rows = []
 
     for item in stats_list:
-        try:
-            
-            if 'gpu_id' in item:
-                print(f"DEBUG: Attempting to insert GPU stats for GPU ID: {item.get('gpu_id')}...")
-                sys.stdout.flush()
-                await gpu_interface.create(item)
-                gpu_stats_inserted_count += 1
-                print(f"DEBUG: Successfully inserted GPU stats for GPU ID: {item.get('gpu_id')}.")
-                sys.stdout.flush()
-            else:
-                
-                if pc_stats_inserted_count == 0:
-                    print("DEBUG: Attempting to insert PC stats...")
-                    sys.stdout.flush()
-                    await pc_interface.create(item)
-                    pc_stats_inserted_count += 1
-                    print("DEBUG: Successfully inserted PC stats.")
-                    sys.stdout.flush()
-                else:
-                    print(f"WARNING: Skipping additional PC stats entry: {item}")
-                    sys.stdout.flush()
-        except Exception as insert_e:
-            print(f"ERROR: Failed to insert stats for item {item}: {insert_e}")
-            sys.stdout.flush()
-            # import traceback
-            # traceback.print_exc() # Uncomment for full traceback if needed
+        row = {'time': fallback_time, **item}
+        if 'gpu_id' in row:
+            gpu_rows.append(row)
+        else:
+            pc_rows.append(row)
+
+    await db_engine.ensure_partitions(row['time'] for row in pc_rows + gpu_rows)
+
+    async with AppSession() as session:
+        async with session.begin():
+            pc_stats_inserted_count = await _write_rows(pc_interface, session, pc_rows, PC_COLUMNS)
+            gpu_stats_inserted_count = await _write_rows(gpu_interface, session, gpu_rows, GPU_COLUMNS)
 
     if pc_stats_inserted_count > 0:
-        print(f"{pc_stats_inserted_count} PC stats entry inserted successfully.")
-        sys.stdout.flush()
+        logger.info("%d PC stats entries inserted successfully.", pc_stats_inserted_count)
     if gpu_stats_inserted_count > 0:
-        print(f"{gpu_stats_inserted_count} GPU stats entries inserted successfully.")
-        sys.stdout.flush()
+        logger.info("%d GPU stats entries inserted successfully.", gpu_stats_inserted_count)
     if pc_stats_inserted_count == 0 and gpu_stats_inserted_count == 0:
-        print("No valid stats found to insert.")
-        sys.stdout.flush()
+        logger.info("No valid stats found to insert.")